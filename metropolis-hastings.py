@@ -1,82 +1,186 @@
-import random
-import json
 import math
 import os
 
+import numpy as np
+from numba import njit, prange
+
+# log probability used for transitions that never occur in the reference text
+LOG_FLOOR = -20.0
+
 
 """
 Function to generate random cipher given an alphabet.
 
 Inputs:
 - alphabet: List of characters in the alphabet
+- rng: A numpy random Generator, or None to create a new one
 
 Outputs:
-- permuted: Random list of unique characters in the alphabet
+- permuted: Random permutation of the alphabet as a uint8 array of indices,
+            mapping index i of the alphabet to index permuted[i]
 """
 
 
-def permuteAlph(alphabet):
+def permuteAlph(alphabet, rng=None):
     """
     Returns a randomly permuted version of the alphabet.
     """
-    permuted = random.sample(alphabet, len(alphabet))
+    if rng is None:
+        rng = np.random.default_rng()
+    permuted = rng.permutation(len(alphabet)).astype(np.uint8)
     return permuted
 
 
+"""
+Function to build a lookup table from byte values to alphabet indices.
+
+Inputs:
+- alphabet (list): A list of characters making up the original alphabet
+
+Outputs:
+- lut (np.ndarray): A uint8 array of length 256 where lut[ord(char)] is the
+                    index of char in the alphabet, or 255 if char is not in
+                    the alphabet
+"""
+
+
+def charIndex(alphabet):
+    lut = np.full(256, 255, dtype=np.uint8)
+    for i, char in enumerate(alphabet):
+        lut[ord(char)] = i
+    return lut
+
+
+"""
+Function to convert a message to an array of alphabet indices.
+
+Inputs:
+- message (str): The message to convert (must be ASCII)
+- lut (np.ndarray): Lookup table returned by charIndex
+
+Outputs:
+- msgIdx (np.ndarray): A uint8 array of alphabet indices, with 255 marking
+                       characters that are not in the alphabet
+"""
+
+
+def toIndices(message, lut):
+    return lut[np.frombuffer(message.encode('ascii'), dtype=np.uint8)]
+
+
 """
 Function to encipher a message.
 
 Inputs:
-- message (str): The message to encipher
-- cipher (list): The cipher which is a list of characters to use on the message
+- msgIdx (np.ndarray): The message to encipher as an array of alphabet indices
+- cipher (np.ndarray): The cipher as an array of alphabet indices, mapping
+                       index i of the alphabet to index cipher[i]
+
+Outputs:
+- encIdx (np.ndarray): The enciphered message as an array of alphabet indices;
+                       characters that are not in the alphabet are left as 255
+"""
+
+
+def encipher(msgIdx, cipher):
+    # extend the cipher over every byte value so that 255 maps to itself and
+    # the whole message is enciphered by a single gather
+    table = np.full(256, 255, dtype=np.uint8)
+    table[:len(cipher)] = cipher
+    return np.take(table, msgIdx)
+
+
+"""
+Function to convert an array of alphabet indices back to a string.
+
+Inputs:
+- msgIdx (np.ndarray): The message as an array of alphabet indices
+- message (str): The original string, used for characters not in the alphabet
 - alphabet (list): A list of characters making up the original alphabet
 
 Outputs:
-- encMessage (str): The enciphered message
+- text (str): The message as a string
 """
 
 
-def encipher(message, cipher, alphabet):
+def toString(msgIdx, message, alphabet):
+    # byte value of each alphabet index, the reverse of the charIndex table
+    alphBytes = np.frombuffer(''.join(alphabet).encode('ascii'), dtype=np.uint8)
+    text = np.frombuffer(message.encode('ascii'), dtype=np.uint8).copy()
+    valid = msgIdx != 255  # keep characters that are not in the alphabet
+    text[valid] = alphBytes[msgIdx[valid]]
+    return text.tobytes().decode('ascii')
 
-    cipherMap = {}
-    for i, char in enumerate(alphabet):
-        try:
-            # each character in cipherMap corresponds to a character in the
-            # cipher according to index
-            cipherMap[char] = cipher[i]
-        except KeyError:
-            continue
 
-    messageList = list(message)  # convert string to list to mutate
+"""
+Function to pick random pairs of letters of a cipher to swap, drawn up front so
+the sampling loops do not call the random number generator. When letter counts
+are given, the first letter is drawn in proportion to how often it appears in
+the message, so swaps between two letters that never appear (which cannot
+change the log probability) are never proposed. The chance of proposing a pair
+does not depend on the current cipher, so the proposal stays symmetric.
 
-    for i, char in enumerate(messageList):
-        try:
-            messageList[i] = cipherMap[char]
-        except KeyError:
-            continue
+Inputs:
+- rng: A numpy random Generator
+- N (int): The number of letters in the cipher
+- shape (tuple): The shape of the batch of pairs to draw
+- freq (np.ndarray): Optional count of each enciphered letter in the message;
+                     ignored if no letter appears
+
+Outputs:
+- pairs (np.ndarray): A uint8 array of shape (*shape, 2) holding two different
+                      random positions in the cipher per entry
+"""
+
+
+def randomPairs(rng, N, shape, freq=None):
+    if freq is None or not freq.any():
+        i = rng.integers(0, N, size=shape)
+    else:
+        i = rng.choice(N, size=shape, p=freq / freq.sum())
+    j = rng.integers(0, N - 1, size=shape)
+    j += j >= i  # make sure the two letters are different
+    # positions fit in a byte, which keeps large pre-drawn batches small
+    return np.stack((i, j), axis=-1).astype(np.uint8)
 
-    # convert the list to string at the end
-    encMessage = ''.join(messageList)
 
-    return encMessage
+"""
+Function to swap two letters of a given cipher in place.
+
+Inputs:
+- cipher (np.ndarray): The reverse cipher whose letters have to be swapped
+- i, j (int): The positions of the letters to swap
+"""
+
+
+@njit(cache=True, fastmath=True)
+def swapCipher(cipher, i, j):
+    cipher[i], cipher[j] = cipher[j], cipher[i]
 
 
 """
-Function to swap two random letters of a given cipher.
+Function to count the bigrams of a block of text, compiled with numba.
 
 Inputs:
-- cipher (str): The reverse cipher whose letters have to be swapped
+- buf: The text as a uint8 array of bytes
+- lut: Lookup table returned by charIndex
+- C: An (N, N) int64 array of bigram counts, updated in place
+- prev: Alphabet index of the byte before buf, or 255 if there is none
 
 Outputs:
-- cipherList (str): A new reverse cipher with two randomly swapped letters
+- prev: Alphabet index of the last byte of buf, to pass on with the next block
 """
 
 
-def swapCipher(cipher):
-    cipherList = list(cipher)
-    i, j = random.sample(range(len(cipherList)), 2)
-    cipherList[i], cipherList[j] = cipherList[j], cipherList[i]
-    return cipherList
+@njit(cache=True)
+def countBigrams(buf, lut, C, prev):
+    for i in range(len(buf)):
+        curr = lut[buf[i]]
+        # handle characters that are not in alphabet by skipping over
+        if prev != 255 and curr != 255:
+            C[prev, curr] += 1
+        prev = curr
+    return prev
 
 
 """
@@ -87,113 +191,199 @@ Inputs:
         Note:
         - Must give full file path
         - Must be a text file
+- chunk_size: Number of bytes to read from the file at a time
 
 Outputs:
-- writeFile: File name to be written to
+- writeFile: File name to be written to, containing the log transition
+             probabilities as an (N, N) float64 array
         Note:
         - Must give full file path
-        - Must be a JSON file
+        - Must be a .npy file
 """
 
 
-def transitionMatrix(readFile, writeFile, alphabet):
-    with open(readFile, 'r') as reader, open(writeFile, 'w') as writer:
+def transitionMatrix(readFile, writeFile, alphabet, chunk_size=1 << 20):
+    N = len(alphabet)
+    lut = charIndex(alphabet)
+    counts = np.zeros((N, N), dtype=np.int64)
 
-        # initializing matrix of 2 dimensional dictionary
-        M = {c1: {c2: 0.0 for c2 in alphabet} for c1 in alphabet}
+    # stream the text through the counter one block at a time, carrying the
+    # last character over so bigrams across block boundaries are counted
+    prev = 255
+    with open(readFile, 'rb') as reader:
+        while True:
+            block = reader.read(chunk_size)
+            if not block:
+                break
+            prev = countBigrams(np.frombuffer(block, dtype=np.uint8), lut,
+                                counts, prev)
 
-        # loop over each line
-        for line in reader:
-            line = line.rstrip()  # remove newline character
-            if len(line) > 0:  # check if line has any real characters
-                for c in range(len(line)-1):  # only go till 2nd last character
-                    try:
-                        # increment each transition
-                        c1 = line[c]
-                        c2 = line[c+1]
-                        M[c1][c2] += 1
-                    # handle characters that are not in alphabet by skipping over
-                    except KeyError:
-                        continue
-        total = 0.0
-        # Normalize the counts to probabilities
-        for c1 in M:
-            total += sum(M[c1].values())
-            # for c2 in M[c1]:
-            #     M[c1][c2] /= total
-        for c1 in M:
-            for c2 in M[c1]:
-                M[c1][c2] /= total
+    # Normalize each row of counts to transition probabilities
+    totals = counts.sum(axis=1, keepdims=True)
+    M = counts / np.maximum(totals, 1)
 
-        # replace all 0.0 probabilities w/ e-20
-        for key, values in M.items():
-            for key2, value2 in values.items():
-                if value2 == 0.0:
-                    M[key][key2] = math.exp(-20)
+    # take logs of the nonzero probabilities, using LOG_FLOOR for the rest
+    logM = np.log(M, out=np.full_like(M, LOG_FLOOR), where=M > 0)
 
-        # storing it in a json file to make reading easier
-        json.dump(M, writer)
+    # storing the log probabilities in a .npy file so they load as an array
+    np.save(writeFile, logM)
 
 
 """
-Function to calculate the acceptance probability.
+Function to count the bigrams of an enciphered message.
 
 Inputs:
-- X: List of characters for current reverse cipher
-- Y: List of characters for new reverse cipher
-- message: String containing a message
-- M: 2-dimensional dictionary containing transitions of letters in given alphabet
-- alphabet: List of characters in the alphabet being used
+- encIdx: The enciphered message as an array of alphabet indices
+- N: Number of characters in the alphabet
 
 Outputs:
-- acceptanceProbability: Float number which is the acceptance probability
+- C: An (N, N) int64 array where C[a][b] is the number of times enciphered
+     index a is followed by enciphered index b in the message
 """
 
 
-def acceptProb(X, Y, encipheredMessage, M, alphabet):
+def bigramCounts(encIdx, N):
+    c1 = encIdx[:-1]
+    c2 = encIdx[1:]
+    # skip transitions involving characters that are not in the alphabet
+    valid = (c1 != 255) & (c2 != 255)
+    C = np.zeros((N, N), dtype=np.int64)
+    np.add.at(C, (c1[valid], c2[valid]), 1)
+    return C
 
-    unscrambledX = encipher(encipheredMessage, alphabet,
-                            X)  # unscramble using cipher X
-    unscrambledY = encipher(encipheredMessage, alphabet,
-                            Y)  # unscramble using cipher Y
-    logProbX = 0.0
-    logProbY = 0.0
 
-    # loop over unscrambled message taking sum of logs of transition probabilities
-    for i in range(len(unscrambledX)-1):
-        try:
-            # calculate log probabilities of consecutive characters in reverse cipher X
-            logProbX += math.log(M[unscrambledX[i]][unscrambledX[i+1]])
-        except KeyError:
-            continue
-    for i in range(len(unscrambledY)-1):
-        try:
-            # calculate log probabilities of consecutive characters in reverse cipher Y
-            logProbY += math.log(M[unscrambledY[i]][unscrambledY[i+1]])
-        except KeyError:
-            continue
+"""
+Function to count the letters of an enciphered message.
+
+Inputs:
+- encIdx: The enciphered message as an array of alphabet indices
+- N: Number of characters in the alphabet
+
+Outputs:
+- freq: An array of length N where freq[a] is the number of times enciphered
+        index a appears in the message
+"""
+
+
+def letterCounts(encIdx, N):
+    # skip characters that are not in the alphabet
+    return np.bincount(encIdx[encIdx != 255], minlength=N)
+
+
+"""
+Function to build a starting reverse cipher by matching letter frequencies.
+The enciphered letters are ranked by how often they appear in the message and
+mapped in order onto the letters ranked by their English frequency, which is
+the stationary distribution of the transition matrix.
+
+Inputs:
+- freq: Letter counts of the enciphered message returned by letterCounts
+- logM: 2-dimensional array containing log transition probabilities of the alphabet
+
+Outputs:
+- cipher: An array of alphabet indices for the reverse cipher, mapping the
+          k-th most frequent enciphered index to the k-th most frequent
+          English index
+"""
+
+
+def frequencyCipher(freq, logM):
+    N = len(logM)
+
+    # power iteration for the stationary distribution of the transition matrix
+    M = np.exp(logM)
+    english = np.full(N, 1.0 / N)
+    for _ in range(100):
+        english = english @ M
+        english /= english.sum()
+
+    cipher = np.empty(N, dtype=np.uint8)
+    cipher[np.argsort(-freq, kind='stable')] = np.argsort(-english, kind='stable')
+    return cipher
+
+
+"""
+Function to find the change in log probability when two letters of a cipher
+are swapped. Only the bigrams starting or ending at the swapped positions
+change, so this touches O(len(alphabet)) entries instead of the whole message.
+
+Inputs:
+- X: Array of alphabet indices for current reverse cipher
+- p, q: The positions of the letters to swap
+- C: Bigram counts of the enciphered message returned by bigramCounts
+- logM: 2-dimensional array containing log transition probabilities of the alphabet
+
+Outputs:
+- diff: Float number which is the log probability of X with the letters at p
+        and q swapped minus that of X
+"""
+
+
+@njit(cache=True, fastmath=True)
+def swapDelta(X, p, q, C, logM):
+    xp = X[p]
+    xq = X[q]
+    diff = 0.0
+    for b in range(len(X)):
+        xb = X[b]
+        # letter at position b after the swap
+        if b == p:
+            yb = xq
+        elif b == q:
+            yb = xp
+        else:
+            yb = xb
+        # bigrams starting at p or q
+        diff += C[p, b] * (logM[xq, yb] - logM[xp, xb])
+        diff += C[q, b] * (logM[xp, yb] - logM[xq, xb])
+        # bigrams ending at p or q, skipping the ones counted above
+        if b != p and b != q:
+            diff += C[b, p] * (logM[xb, xq] - logM[xb, xp])
+            diff += C[b, q] * (logM[xb, xp] - logM[xb, xq])
+    return diff
+
+
+"""
+Function to decide whether to accept a new reverse cipher.
+
+Inputs:
+- X: Array of alphabet indices for current reverse cipher
+- p, q: The positions of the letters to swap in X, giving the new reverse cipher Y
+- C: Bigram counts of the enciphered message returned by bigramCounts
+- logM: 2-dimensional array containing log transition probabilities of the alphabet
+- logProbX: Float number which is the log probability of X
+- beta: Inverse temperature the log probabilities are scaled by (1.0 samples
+        the original distribution)
+- u: Uniform random number in [0, 1) for the acceptance test
+
+Outputs:
+- accept: Boolean which is True if Y should replace X
+- logProbY: Float number which is the log probability of Y
+"""
+
+
+@njit(cache=True, fastmath=True)
+def acceptProb(X, p, q, C, logM, logProbX, beta, u):
 
     # difference to be used to calculate acceptance probability to avoid math error
-    diff = logProbY - logProbX
+    diff = swapDelta(X, p, q, C, logM)
+    logProbY = logProbX + diff
 
-    # Avoiding overflow by comparing values in log space
-    if diff > 0:
-        acceptanceProbability = 1.0
-    else:
-        acceptanceProbability = math.exp(diff)  # e^<any negative value> is < 1
+    # always accept when Y is at least as likely, which skips taking the log of
+    # u; otherwise accept with probability e^(beta*diff), compared in log space
+    accept = diff >= 0 or math.log(u) < beta * diff
 
-    return acceptanceProbability
+    return accept, logProbY
 
 
 """
 Function to find the log probability given a cipher.
 
 Inputs:
-- cipher: A list of characters for one cipher
-- encipheredMessage: An enciphered message represented as a string
-- M: A nested dictionary containing the transition probabilities in the alphabet
-     using a pre-defined text of English Language
-- alphabet: A list of characters that are used in the message
+- cipher: An array of alphabet indices for one reverse cipher
+- encIdx: The enciphered message as an array of alphabet indices
+- logM: A 2-dimensional array containing the log transition probabilities in the
+        alphabet using a pre-defined text of English Language
 
 Outputs:
 - logProb: A float representing the sum of logs of each character's transition
@@ -201,53 +391,251 @@ Outputs:
 """
 
 
-def measure(cipher, encipheredMessage, M, alphabet):
+@njit(cache=True, fastmath=True)
+def measure(cipher, encIdx, logM):
     logProb = 0.0
-    unscrambled = encipher(encipheredMessage, alphabet, cipher)
-    for i in range(len(unscrambled)-1):
-        try:
-            logProb += math.log(M[unscrambled[i]][unscrambled[i+1]])
-        except KeyError:
+    for i in range(len(encIdx)-1):
+        c1 = encIdx[i]
+        c2 = encIdx[i+1]
+        # skip transitions involving characters that are not in the alphabet
+        if c1 == 255 or c2 == 255:
             continue
+        logProb += logM[cipher[c1], cipher[c2]]
     return logProb
 
 
+"""
+Function to run the Metropolis-Hastings loop, compiled with numba.
+
+Inputs:
+- encIdx: The enciphered message as an array of alphabet indices
+- C: Bigram counts of the enciphered message returned by bigramCounts
+- logM: A 2-dimensional array containing the log transition probabilities in the
+        alphabet using a pre-defined text of English Language
+- currCipher: An array of alphabet indices for the initial reverse cipher
+- pairs: A (max_iter, 2) array of the positions to swap at each iteration
+- us: Array of max_iter uniform random numbers for the acceptance tests
+- best_every: Number of iterations between checks for a new best cipher, plus
+              one final check at the end of the run; the check runs before the
+              iterations whose number is a multiple of best_every
+
+Outputs:
+- bestRevCipher: An array of alphabet indices for the best reverse cipher found
+"""
+
+
+@njit(cache=True, fastmath=True)
+def mhLoop(encIdx, C, logM, currCipher, pairs, us, best_every):
+    # current best cipher is initial cipher
+    currLogProb = measure(currCipher, encIdx, logM)
+    bestRevCipher = currCipher.copy()
+    bestLogProb = currLogProb
+
+    for i in range(len(us)):
+        # check for best cipher, comparing the carried log probabilities
+        if i % best_every == 0 and currLogProb > bestLogProb:
+            bestRevCipher[:] = currCipher
+            bestLogProb = currLogProb
+        p = pairs[i, 0]
+        q = pairs[i, 1]
+        accept, nextLogProb = acceptProb(
+            currCipher, p, q, C, logM, currLogProb, 1.0, us[i])
+        # check to accept new cipher, swapping in place only when accepted
+        if accept:
+            swapCipher(currCipher, p, q)  # new reverse cipher
+            currLogProb = nextLogProb
+
+    # check for best cipher in the final state
+    if currLogProb > bestLogProb:
+        bestRevCipher[:] = currCipher
+    return bestRevCipher
+
+
 """
 Function to run the Metropolis-Hastings algorithm with max iterations pre-defined
 
 Inputs:
 - alphabet: A list of characters that are used in the message
-- encipheredMessage: An enciphered message represented as a string
-- M: A nested dictionary containing the transition probabilities in the alphabet
-     using a pre-defined text of English Language
+- encIdx: The enciphered message as an array of alphabet indices
+- logM: A 2-dimensional array containing the log transition probabilities in the
+        alphabet using a pre-defined text of English Language
+- max_iter: Number of iterations to run
+- best_every: Number of iterations between checks for a new best cipher, plus
+              one final check at the end of the run
+- seed: Seed for the random number generator, or None for a random seed
 
 Outputs:
-- bestRevCipher: A list of characters that are found to be the best reverse
-                 cipher by the metropolis-hastings algorithm
+- bestRevCipher: An array of alphabet indices that is found to be the best
+                 reverse cipher by the metropolis-hastings algorithm, mapping
+                 enciphered index i to unscrambled index bestRevCipher[i]
 """
 
 
-def metropolisHastings(alphabet, encipheredMessage, M, max_iter=10000):
+def metropolisHastings(alphabet, encIdx, logM, max_iter=10000, best_every=1,
+                       seed=None):
+    rng = np.random.default_rng(seed)
+    N = len(alphabet)
+    C = bigramCounts(encIdx, N)
+    freq = letterCounts(encIdx, N)
 
-    # initial cipher
-    currCipher = permuteAlph(alphabet)
+    # initial cipher matches the letter frequencies of the message
+    currCipher = frequencyCipher(freq, logM)
 
-    # current best cipher is initial cipher
-    bestRevCipher = currCipher.copy()
+    pairs = randomPairs(rng, N, (max_iter,), freq)
+    us = rng.random(max_iter)
+
+    return mhLoop(encIdx, C, logM, currCipher, pairs, us, best_every)
+
+
+"""
+Function to run a block of Metropolis-Hastings steps on every tempered chain,
+compiled with numba. The chains only read the shared bigram counts and
+transition matrix, so they run in parallel across CPU cores.
+
+Inputs:
+- ciphers: A (K, len(alphabet)) array with the current reverse cipher of each
+           chain, updated in place
+- logProbs: Array of the K current log probabilities, updated in place
+- bestRevCipher: Array with the best reverse cipher seen by the beta = 1.0
+                 chain, updated in place
+- bestLogProb: Array holding the log probability of bestRevCipher, updated in
+               place
+- C: Bigram counts of the enciphered message returned by bigramCounts
+- logM: A 2-dimensional array containing the log transition probabilities in the
+        alphabet using a pre-defined text of English Language
+- betas: Decreasing array of K inverse temperatures, starting at 1.0
+- pairs: A (K, n_steps, 2) array of the positions to swap at each step
+- us: A (K, n_steps) array of uniform random numbers for the acceptance tests
+- offset: Iteration number of the first step of the block within the whole run
+- best_every: Number of iterations between checks for a new best cipher; the
+              check runs before the steps whose iteration number is a multiple
+              of best_every
+"""
+
+
+@njit(cache=True, fastmath=True, parallel=True)
+def localMoves(ciphers, logProbs, bestRevCipher, bestLogProb, C, logM, betas,
+               pairs, us, offset, best_every):
+    for k in prange(len(betas)):
+        cipher = ciphers[k]
+        for i in range(us.shape[1]):
+            # check for best cipher, only on the chain that is reported
+            if (k == 0 and (offset + i) % best_every == 0
+                    and logProbs[0] > bestLogProb[0]):
+                bestRevCipher[:] = cipher
+                bestLogProb[0] = logProbs[0]
+            p = pairs[k, i, 0]
+            q = pairs[k, i, 1]
+            accept, nextLogProb = acceptProb(
+                cipher, p, q, C, logM, logProbs[k], betas[k], us[k, i])
+            if accept:
+                swapCipher(cipher, p, q)
+                logProbs[k] = nextLogProb
+
+
+"""
+Function to run parallel tempering, compiled with numba. The chains run
+swap_every Metropolis-Hastings steps in parallel on the log probabilities
+scaled by their own beta, then every pair of adjacent chains proposes to
+exchange ciphers.
+
+Inputs:
+- encIdx: The enciphered message as an array of alphabet indices
+- C: Bigram counts of the enciphered message returned by bigramCounts
+- logM: A 2-dimensional array containing the log transition probabilities in the
+        alphabet using a pre-defined text of English Language
+- ciphers: A (len(betas), len(alphabet)) array with one initial reverse cipher
+           per chain
+- betas: Decreasing array of K inverse temperatures, starting at 1.0
+- pairs: A (K, max_iter, 2) array of the positions to swap at each iteration
+- us: A (K, max_iter) array of uniform random numbers for the acceptance tests
+- swapUs: A (ceil(max_iter / swap_every), K - 1) array of uniform random numbers
+          for the exchange proposals
+- swap_every: Number of iterations between rounds of exchange proposals; the
+              last block is shorter when max_iter is not a multiple of it
+- best_every: Number of iterations between checks for a new best cipher, plus
+              one final check at the end of the run
 
-    for i in range(max_iter):
-        nextCipher = swapCipher(currCipher).copy()  # avoid pointer issue
-        acceptanceProbability = acceptProb(
-            currCipher, nextCipher, encipheredMessage, M, alphabet)
-        # check to accept new cipher
-        if acceptanceProbability > random.uniform(0.0, 1.0):
-            currCipher = nextCipher.copy()  # new reverse cipher
-            # check for best cipher
-            if measure(currCipher, encipheredMessage, M, alphabet) > measure(bestRevCipher, encipheredMessage, M, alphabet):
-                bestRevCipher = currCipher.copy()
+Outputs:
+- bestRevCipher: An array of alphabet indices for the best reverse cipher found
+                 by the beta = 1.0 chain
+"""
+
+
+@njit(cache=True, fastmath=True)
+def ptLoop(encIdx, C, logM, ciphers, betas, pairs, us, swapUs, swap_every,
+           best_every):
+    K = len(betas)
+
+    logProbs = np.empty(K)
+    for k in range(K):
+        logProbs[k] = measure(ciphers[k], encIdx, logM)
+
+    # current best cipher is initial cipher of the beta = 1.0 chain
+    bestRevCipher = ciphers[0].copy()
+    bestLogProb = logProbs[:1].copy()
+
+    for i in range(len(swapUs)):
+        block = slice(i * swap_every, (i + 1) * swap_every)
+        localMoves(ciphers, logProbs, bestRevCipher, bestLogProb, C, logM,
+                   betas, pairs[:, block], us[:, block], i * swap_every,
+                   best_every)
+
+        # propose exchanging the ciphers of each pair of adjacent chains
+        for l in range(K - 1):
+            diff = (betas[l] - betas[l+1]) * (logProbs[l+1] - logProbs[l])
+            if diff >= 0 or math.log(swapUs[i, l]) < diff:
+                for b in range(ciphers.shape[1]):
+                    ciphers[l, b], ciphers[l+1, b] = ciphers[l+1, b], ciphers[l, b]
+                logProbs[l], logProbs[l+1] = logProbs[l+1], logProbs[l]
+
+    # check for best cipher in the final state of the beta = 1.0 chain
+    if logProbs[0] > bestLogProb[0]:
+        bestRevCipher[:] = ciphers[0]
     return bestRevCipher
 
 
+"""
+Function to run parallel tempering with max iterations pre-defined
+
+Inputs:
+- alphabet: A list of characters that are used in the message
+- encIdx: The enciphered message as an array of alphabet indices
+- logM: A 2-dimensional array containing the log transition probabilities in the
+        alphabet using a pre-defined text of English Language
+- betas: Decreasing list of inverse temperatures, one per chain, starting at 1.0
+- max_iter: Number of iterations to run on each chain
+- swap_every: Number of iterations between rounds of exchange proposals
+- best_every: Number of iterations between checks for a new best cipher, plus
+              one final check at the end of the run
+- seed: Seed for the random number generator, or None for a random seed
+
+Outputs:
+- bestRevCipher: An array of alphabet indices that is found to be the best
+                 reverse cipher by the beta = 1.0 chain, mapping enciphered
+                 index i to unscrambled index bestRevCipher[i]
+"""
+
+
+def parallelTempering(alphabet, encIdx, logM, betas, max_iter=10000,
+                      swap_every=10, best_every=1, seed=None):
+    rng = np.random.default_rng(seed)
+    N = len(alphabet)
+    K = len(betas)
+    rounds = -(-max_iter // swap_every)  # the last block may be partial
+    C = bigramCounts(encIdx, N)
+    freq = letterCounts(encIdx, N)
+
+    # initial cipher for every chain matches the letter frequencies of the message
+    ciphers = np.tile(frequencyCipher(freq, logM), (K, 1))
+    pairs = randomPairs(rng, N, (K, max_iter), freq)
+    us = rng.random((K, max_iter))
+    swapUs = rng.random((rounds, K - 1))
+
+    return ptLoop(encIdx, C, logM, ciphers, np.asarray(betas, dtype=np.float64),
+                  pairs, us, swapUs, swap_every, best_every)
+
+
 if __name__ == "__main__":
 
     alphabet = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm',
@@ -286,23 +674,26 @@ if __name__ == "__main__":
     and dedication to the craft of cooking.
     """
     script_dir = os.path.dirname(__file__)
+    lut = charIndex(alphabet)
+    msgIdx = toIndices(message, lut)
     cipher = permuteAlph(alphabet)
-    encipheredMessage = encipher(
-        message, cipher, alphabet)  # enciphered message
+    encIdx = encipher(msgIdx, cipher)  # enciphered message
+    encipheredMessage = toString(encIdx, message, alphabet)
 
-    # reading transition matrix
-    with open(os.path.join(script_dir, 'TransitionMatrix.json')) as reader:
-        M = json.load(reader)
+    # reading log transition matrix
+    logM = np.load(os.path.join(script_dir, 'TransitionMatrix.npy'),
+                   mmap_mode='r')
 
-    revCipher = metropolisHastings(alphabet, encipheredMessage, M).copy()
+    betas = [1.0, 0.75, 0.5, 0.25]
+    revCipher = parallelTempering(alphabet, encIdx, logM, betas)
     print("The message is:\n", message)
     print("\n")
-    print("The cipher is:\n", cipher)
+    print("The cipher is:\n", [alphabet[i] for i in cipher])
     print("\n")
     print("The enciphered message is:\n", encipheredMessage)
     print("\n")
-    print("The best reverse cipher is:\n", revCipher)
+    print("The best reverse cipher is:\n", [alphabet[i] for i in revCipher])
     print("\n")
     print("The message with this reverse cipher is:\n",
-          encipher(encipheredMessage, alphabet, revCipher))
+          toString(encipher(encIdx, revCipher), message, alphabet))
     
\ No newline at end of file